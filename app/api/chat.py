@@ -2,9 +2,12 @@
 Chat API endpoints
 """
 
+import asyncio
 import logging
+import orjson
 from fastapi import APIRouter, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 import time
 from app.models.chat import ChatRequest, ChatResponse, ErrorResponse
 from app.services.ai_service import AIService
@@ -13,22 +16,47 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# How long a chat request may wait for a free slot before being rejected with 429
+INFLIGHT_ACQUIRE_TIMEOUT = 0.05  # seconds
+
+# All routes are `async def` and must never block the event loop:
+# - CPU-bound model inference runs on the AI service's inference threads and is only awaited here
+# - IO-bound conversation storage is awaited natively (Redis) or is a plain in-memory lookup
+# - Any future sync/blocking call must be wrapped in `asyncio.to_thread`
+
 def get_ai_service(request: Request) -> AIService:
     """Dependency to get AI service from app state"""
     if not hasattr(request.app.state, 'ai_service') or request.app.state.ai_service is None:
         raise HTTPException(status_code=503, detail="AI service not available")
     return request.app.state.ai_service
 
+async def acquire_inflight_slot(request: Request) -> asyncio.Semaphore:
+    """Reserve one of MAX_INFLIGHT chat slots, rejecting with 429 when the server is saturated"""
+    inflight: asyncio.Semaphore = request.app.state.inflight
+    try:
+        await asyncio.wait_for(inflight.acquire(), timeout=INFLIGHT_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("⏳ Chat request rejected: server busy")
+        raise HTTPException(
+            status_code=429,
+            detail="Server busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    return inflight
+
+# CPU-bound: awaits inference on the model threads
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(
     chat_request: ChatRequest,
+    request: Request,
     ai_service: AIService = Depends(get_ai_service)
 ):
     """
     Main chat endpoint - send a message and get an AI response
     """
+    inflight = await acquire_inflight_slot(request)
     try:
-        logger.info(f"📨 Received chat request: {chat_request.message[:50]}...")
+        logger.info("📨 Received chat request: %s...", chat_request.message[:50])
         
         # Process the chat request
         result = await ai_service.chat(
@@ -42,12 +70,58 @@ async def chat_endpoint(
         return ChatResponse(**result)
         
     except Exception as e:
-        logger.error(f"❌ Chat endpoint error: {e}")
+        logger.error("❌ Chat endpoint error: %s", e)
         raise HTTPException(
             status_code=500, 
             detail=f"Internal server error: {str(e)}"
         )
+    finally:
+        inflight.release()
 
+# CPU-bound: tokens are read from the model threads as they are generated
+@router.post("/chat/stream")
+async def chat_stream_endpoint(
+    chat_request: ChatRequest,
+    request: Request,
+    ai_service: AIService = Depends(get_ai_service)
+):
+    """
+    Streaming chat endpoint - sends the AI response as server-sent events while it is generated.
+    Each event is `data: {"token": "..."}`, followed by a final event with the ChatResponse fields and `"done": true`.
+    Tokens have leading speaker markers and any echo of the message stripped; the final event's `response` is the
+    fully cleaned reply (as stored in the conversation) and should replace the streamed text once it arrives
+    """
+    logger.info("📨 Received streaming chat request: %s...", chat_request.message[:50])
+    inflight = await acquire_inflight_slot(request)
+    released = False
+
+    def release_slot():
+        # Called when the stream ends and again as a background task (which also runs if the
+        # client disconnects before streaming starts); only the first call releases the slot
+        nonlocal released
+        if not released:
+            released = True
+            inflight.release()
+
+    async def event_stream():
+        try:
+            async for event in ai_service.chat_stream(
+                message=chat_request.message,
+                conversation_id=chat_request.conversation_id,
+                conversation_history=chat_request.conversation_history,
+                context=chat_request.context
+            ):
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+        finally:
+            release_slot()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        background=BackgroundTask(release_slot)
+    )
+
+# IO-bound: conversation store lookup
 @router.get("/conversation/{conversation_id}")
 async def get_conversation_history(
     conversation_id: str,
@@ -57,16 +131,17 @@ async def get_conversation_history(
     Retrieve conversation history for a specific conversation ID
     """
     try:
-        history = ai_service.get_conversation_history(conversation_id)
+        history = await ai_service.get_conversation_history(conversation_id)
         return {
             "conversation_id": conversation_id,
             "messages": history,
             "message_count": len(history)
         }
     except Exception as e:
-        logger.error(f"❌ Error retrieving conversation: {e}")
+        logger.error("❌ Error retrieving conversation: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+# IO-bound: conversation store delete
 @router.delete("/conversation/{conversation_id}")
 async def clear_conversation(
     conversation_id: str,
@@ -76,41 +151,53 @@ async def clear_conversation(
     Clear conversation history for a specific conversation ID
     """
     try:
-        ai_service.clear_conversation(conversation_id)
+        await ai_service.clear_conversation(conversation_id)
         return {"message": f"Conversation {conversation_id} cleared successfully"}
     except Exception as e:
-        logger.error(f"❌ Error clearing conversation: {e}")
+        logger.error("❌ Error clearing conversation: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+# In-memory only: returns settings loaded at startup
 @router.get("/config")
 async def get_business_config(ai_service: AIService = Depends(get_ai_service)):
     """
     Get current business configuration
     """
     try:
+        business_config = ai_service.business_config
         return {
-            "business_config": ai_service.business_config,
+            "business_config": {
+                **business_config,
+                # Topics are stored as frozensets; list them in a stable order
+                "allowed_topics": sorted(business_config["allowed_topics"]),
+                "restricted_topics": sorted(business_config["restricted_topics"])
+            },
             "model_info": {
                 "name": ai_service.model_name,
                 "device": "CPU" if ai_service.device == -1 else f"GPU:{ai_service.device}"
             }
         }
     except Exception as e:
-        logger.error(f"❌ Error getting config: {e}")
+        logger.error("❌ Error getting config: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+# /test body serialized once around the timestamp, the only part that changes per request
+TEST_BODY_PREFIX = orjson.dumps({"message": "Chat API is working! 🎉"})[:-1] + b',"timestamp":'
+TEST_BODY_SUFFIX = b',"endpoints":' + orjson.dumps({
+    "chat": "POST /api/v1/chat",
+    "chat_stream": "POST /api/v1/chat/stream",
+    "history": "GET /api/v1/conversation/{id}",
+    "clear": "DELETE /api/v1/conversation/{id}",
+    "config": "GET /api/v1/config"
+}) + b"}"
+
+# In-memory only: static response
 @router.post("/test")
 async def test_chat():
     """
     Simple test endpoint to verify API is working
     """
-    return {
-        "message": "Chat API is working! 🎉",
-        "timestamp": time.time(),
-        "endpoints": {
-            "chat": "POST /api/v1/chat",
-            "history": "GET /api/v1/conversation/{id}",
-            "clear": "DELETE /api/v1/conversation/{id}",
-            "config": "GET /api/v1/config"
-        }
-    }
\ No newline at end of file
+    return Response(
+        content=TEST_BODY_PREFIX + orjson.dumps(time.time()) + TEST_BODY_SUFFIX,
+        media_type="application/json"
+    )
\ No newline at end of file
@@ -3,9 +3,18 @@ Application configuration settings
 """
 
 import os
-from typing import List
+from functools import cached_property, lru_cache
+from typing import List, Tuple
+from pydantic import computed_field, field_validator
 from pydantic_settings import BaseSettings
 
+# Supported MODEL_QUANTIZATION values
+QUANTIZATION_MODES = ("none", "int8", "int4")
+
+def split_csv(value: str) -> Tuple[str, ...]:
+    """Split a comma-separated setting into stripped, non-empty items"""
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
 class Settings(BaseSettings):
     # API Settings
     API_V1_STR: str = "/api/v1"
@@ -23,6 +32,31 @@ class Settings(BaseSettings):
     MODEL_DEVICE: int = int(os.getenv("MODEL_DEVICE", -1))  # -1 for CPU, 0 for GPU
     MAX_LENGTH: int = int(os.getenv("MAX_LENGTH", 512))
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", 0.7))
+    # Weight quantization: none, int8 (GPU via bitsandbytes, CPU via ONNX Runtime) or int4 (GPU only)
+    MODEL_QUANTIZATION: str = os.getenv("MODEL_QUANTIZATION", "none").lower()
+    QUANTIZED_MODEL_DIR: str = os.getenv("QUANTIZED_MODEL_DIR", ".model_cache/onnx")
+    # Fused attention kernels (SDPA, or BetterTransformer via optimum) and torch.compile; unquantized models only
+    MODEL_BETTERTRANSFORMER: bool = os.getenv("MODEL_BETTERTRANSFORMER", "false").lower() == "true"
+    MODEL_COMPILE: bool = os.getenv("MODEL_COMPILE", "false").lower() == "true"
+
+    # Load the model once before forking workers (set by gunicorn.conf.py, CPU only)
+    PRELOAD_MODEL: bool = os.getenv("PRELOAD_MODEL", "false").lower() == "true"
+
+    # Inference Batching
+    # Concurrent prompts arriving within BATCH_WINDOW_MS are generated together
+    BATCH_MAX_SIZE: int = int(os.getenv("BATCH_MAX_SIZE", 8))
+    BATCH_WINDOW_MS: int = int(os.getenv("BATCH_WINDOW_MS", 20))
+    # Threads allowed to run the model at once (1 per model instance / GPU)
+    INFER_CONCURRENCY: int = int(os.getenv("INFER_CONCURRENCY", 1))
+    # Prompts allowed to wait for the model; further requests wait before queueing
+    INFER_QUEUE_SIZE: int = int(os.getenv("INFER_QUEUE_SIZE", 64))
+    # Concurrent chat requests per worker; beyond this the API responds 429 Too Many Requests
+    MAX_INFLIGHT: int = int(os.getenv("MAX_INFLIGHT", 32))
+
+    # Response Cache (only used when generation is deterministic)
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", 4096))
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", 600))  # seconds
     
     # Business Context
     BUSINESS_NAME: str = os.getenv("BUSINESS_NAME", "Demo Business")
@@ -46,6 +80,16 @@ class Settings(BaseSettings):
         "medical advice,legal advice,financial advice,personal information"
     )
     
+    # Conversation Memory
+    # In-memory by default; set REDIS_URL to share history across workers and instances
+    MAX_CONVERSATIONS: int = int(os.getenv("MAX_CONVERSATIONS", 10000))
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+    REDIS_WARM_CONNECTIONS: int = int(os.getenv("REDIS_WARM_CONNECTIONS", 5))  # opened at startup
+    # How long a command waits for a free pooled connection once all are in use
+    REDIS_POOL_TIMEOUT: float = float(os.getenv("REDIS_POOL_TIMEOUT", 5))  # seconds
+    CONVERSATION_TTL: int = int(os.getenv("CONVERSATION_TTL", 86400))  # seconds, Redis only
+
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = int(os.getenv("RATE_LIMIT_REQUESTS", 100))
     RATE_LIMIT_WINDOW: int = int(os.getenv("RATE_LIMIT_WINDOW", 3600))  # seconds
@@ -54,9 +98,39 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
     DEBUG: bool = ENVIRONMENT == "development"
     
+    @field_validator("MODEL_QUANTIZATION")
+    @classmethod
+    def validate_quantization(cls, value: str) -> str:
+        """Reject unknown quantization modes at startup instead of silently picking one"""
+        value = value.lower()
+        if value not in QUANTIZATION_MODES:
+            raise ValueError(f"MODEL_QUANTIZATION must be one of: {', '.join(QUANTIZATION_MODES)}")
+        return value
+
+    # Comma-separated settings, split once
+    @computed_field
+    @cached_property
+    def allowed_origins_list(self) -> Tuple[str, ...]:
+        return split_csv(self.ALLOWED_ORIGINS)
+
+    @computed_field
+    @cached_property
+    def allowed_topics_list(self) -> Tuple[str, ...]:
+        return split_csv(self.ALLOWED_TOPICS)
+
+    @computed_field
+    @cached_property
+    def restricted_topics_list(self) -> Tuple[str, ...]:
+        return split_csv(self.RESTRICTED_TOPICS)
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the shared settings instance (environment is read once)"""
+    return Settings()
+
 # Create settings instance
-settings = Settings()
\ No newline at end of file
+settings = get_settings()
\ No newline at end of file
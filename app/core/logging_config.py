@@ -0,0 +1,46 @@
+"""
+Logging configuration - records are queued and written by a background thread
+"""
+
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging(level: int = logging.INFO):
+    """Route root logging through a queue so stream writes never block the event loop"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _restart_in_child():
+    # The writer thread does not survive fork (e.g. gunicorn workers), so each child starts its own
+    if _listener is not None:
+        setup_logging(logging.getLogger().level)
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_in_child)
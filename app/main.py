@@ -5,21 +5,34 @@ A proof of concept for business-context chatbots
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 import os
+import orjson
 from app.api.chat import router as chat_router
 from app.core.config import settings
+from app.core.logging_config import setup_logging
 from app.services.ai_service import AIService
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (written from a background thread)
+setup_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Global AI service instance
 ai_service = None
 
+# Load the model at import time so a pre-forking server (gunicorn --preload) loads it once
+# in the master and every forked worker shares the same weight pages copy-on-write.
+# CUDA cannot be initialized before fork, so GPU deployments load per worker instead.
+if settings.PRELOAD_MODEL:
+    if settings.MODEL_DEVICE == -1:
+        ai_service = AIService()
+        ai_service.load_model()
+    else:
+        logger.warning("⚠️ PRELOAD_MODEL is ignored on GPU; loading the model in each worker")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
@@ -28,18 +41,23 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting AI Chatbot API...")
     try:
-        ai_service = AIService()
+        if ai_service is None:
+            ai_service = AIService()
         await ai_service.initialize()
         logger.info("✅ AI Service initialized successfully")
         app.state.ai_service = ai_service
+        # Concurrent chat requests allowed before new ones are rejected with 429
+        app.state.inflight = asyncio.Semaphore(settings.MAX_INFLIGHT)
     except Exception as e:
-        logger.error(f"❌ Failed to initialize AI service: {e}")
+        logger.error("❌ Failed to initialize AI service: %s", e)
         raise
     
     yield
     
     # Shutdown
     logger.info("🛑 Shutting down AI Chatbot API...")
+    if ai_service is not None:
+        await ai_service.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -50,11 +68,9 @@ app = FastAPI(
 )
 
 # Add CORS middleware
-# Convert comma-separated ALLOWED_ORIGINS to list
-allowed_origins = [origin.strip() for origin in settings.ALLOWED_ORIGINS.split(",")]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=allowed_origins,
+    allow_origins=settings.allowed_origins_list,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -63,14 +79,17 @@ app.add_middleware(
 # Include routers
 app.include_router(chat_router, prefix="/api/v1", tags=["chat"])
 
+# Static body, serialized once at import
+ROOT_BODY = orjson.dumps({
+    "message": "AI Chatbot API is running! 🤖",
+    "version": "1.0.0",
+    "docs": "/docs"
+})
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    return {
-        "message": "AI Chatbot API is running! 🤖",
-        "version": "1.0.0",
-        "docs": "/docs"
-    }
+    return Response(content=ROOT_BODY, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
@@ -86,7 +105,7 @@ async def health_check():
             "model": app.state.ai_service.model_name if app.state.ai_service else "unknown"
         }
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
+        logger.error("Health check failed: %s", e)
         return JSONResponse(
             status_code=503,
             content={"status": "unhealthy", "error": str(e)}
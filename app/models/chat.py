@@ -2,10 +2,13 @@
 Pydantic models for API request/response validation
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
+# Only the most recent messages of a request's history are used to build the prompt
+PROMPT_HISTORY_MESSAGES = 2
+
 class ChatMessage(BaseModel):
     """Single chat message"""
     role: str = Field(..., description="Message role: 'user' or 'assistant'")
@@ -18,12 +21,20 @@ class ChatRequest(BaseModel):
     conversation_id: Optional[str] = Field(default=None, description="Conversation ID for context")
     context: Optional[str] = Field(default=None, description="Additional context")
     conversation_history: Optional[List[ChatMessage]] = Field(default=[], description="Previous messages")
+
+    @field_validator("conversation_history", mode="before")
+    @classmethod
+    def keep_recent_history(cls, value: Any) -> Any:
+        """Drop older messages before validation so long histories don't cost a ChatMessage per item"""
+        if isinstance(value, list):
+            return value[-PROMPT_HISTORY_MESSAGES:]
+        return value
     
     class Config:
         json_schema_extra = {
             "example": {
                 "message": "What are your business hours?",
-                "conversation_id": "abc123",
+                "conversation_id": "3f9a1c7e5b2d4086a1e9c4b7d2f60a18",
                 "conversation_history": [
                     {"role": "user", "content": "Hello"},
                     {"role": "assistant", "content": "Hi! How can I help you today?"}
@@ -43,7 +54,7 @@ class ChatResponse(BaseModel):
         json_schema_extra = {
             "example": {
                 "response": "Our business hours are 9 AM to 6 PM, Monday through Friday.",
-                "conversation_id": "abc123",
+                "conversation_id": "3f9a1c7e5b2d4086a1e9c4b7d2f60a18",
                 "model_used": "microsoft/DialoGPT-medium",
                 "processing_time": 1.23,
                 "tokens_used": 45
@@ -3,19 +3,75 @@ AI Service - Core chatbot logic with HuggingFace and LangChain
 """
 
 import asyncio
+import hashlib
 import logging
+import os
+import re
+import secrets
+import sys
+import threading
 import time
-import uuid
-from typing import List, Dict, Optional, Tuple
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import AsyncIterator, FrozenSet, List, Dict, Optional, Pattern, Tuple, Union
+from cachetools import TTLCache
+from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList, TextStreamer
 import torch
 from app.core.config import settings
-from app.models.chat import ChatMessage
+from app.models.chat import ChatMessage, PROMPT_HISTORY_MESSAGES
+from app.services.conversation_store import create_conversation_store
 
 logger = logging.getLogger(__name__)
 
+class AsyncTextStreamer(TextStreamer, StoppingCriteria):
+    """Streams decoded text from the generating thread into an asyncio queue, stopping once the reader is gone"""
+
+    def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, **decode_kwargs):
+        super().__init__(tokenizer, skip_prompt=True, **decode_kwargs)
+        self.loop = loop
+        # Text chunks, then None once generation ends
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = threading.Event()
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+        if stream_end:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        # Stopping criterion, checked by generate() after every token
+        return torch.full((input_ids.shape[0],), self.cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
 class AIService:
     """Core AI service handling chat interactions"""
+
+    # Keyword patterns for common questions, in priority order
+    DIRECT_ANSWER_KEYWORDS = {
+        "hours": ["hours", "open", "close", "when are you open", "what time"],
+        "location": ["location", "address", "where are you", "where located"],
+        "contact": ["contact", "phone", "email", "call", "reach"],
+        "pricing": ["price", "cost", "how much", "pricing", "plan"],
+        "shipping": ["shipping", "delivery", "ship"],
+        "returns": ["return", "refund", "money back"],
+        "services": ["service", "what do you do", "what do you offer"],
+    }
+
+    # Leading speaker markers DialoGPT may echo back, e.g. "Bot: Human: ..."
+    RESPONSE_SPEAKERS = ("ASSISTANT", "Assistant", "AI", "Bot", "Human", "USER", "User")
+    RESPONSE_PREFIX_RE = re.compile(rf"^(?:(?:{'|'.join(RESPONSE_SPEAKERS)}):\s*)+")
+    # Complete markers, to recognise a partial one at the start of a stream
+    RESPONSE_MARKERS = tuple(f"{speaker}:" for speaker in RESPONSE_SPEAKERS)
+
+    # Prompt prefix for each message role
+    ROLE_PREFIXES = {"user": "Human: ", "assistant": "Bot: "}
+
+    # Sampling parameters shared by every generation call
+    GENERATION_KWARGS = {
+        "max_new_tokens": 50,  # Reduced for DialoGPT-small - it works better with shorter responses
+        "temperature": 0.8,  # Slightly higher for more creative responses
+        "top_p": 0.9,  # Nucleus sampling for better quality
+        "no_repeat_ngram_size": 3  # Prevent repetition
+    }
     
     def __init__(self):
         self.model = None
@@ -23,36 +79,51 @@ class AIService:
         self.pipeline = None
         self.model_name = settings.MODEL_NAME
         self.device = settings.MODEL_DEVICE
-        self.conversation_memory: Dict[str, List[ChatMessage]] = {}
+        # Keep only last 10 messages per conversation
+        self.conversation_store = create_conversation_store(max_messages=10)
         self.business_config = self._load_business_config()
+        self._restricted_re = self._compile_topic_pattern(self.business_config["restricted_topics"])
+        self._direct_answers = self._extract_direct_answers(settings.BUSINESS_DETAILS)
+        self._direct_answer_re = self._compile_direct_answer_pattern(self._direct_answers)
+        self._batch_queue: Optional[asyncio.Queue] = None
+        self._batch_worker_tasks: List[asyncio.Task] = []
+        self._infer_executor: Optional[ThreadPoolExecutor] = None
+        self._response_cache: Optional[TTLCache] = None
+        self._optimizable = False
+        self._pending_writes = set()
         
-    async def initialize(self):
-        """Initialize the AI model"""
-        logger.info(f"🤖 Loading model: {self.model_name}")
+    def load_model(self):
+        """Load the AI model (blocking)"""
+        logger.info("🤖 Loading model: %s", self.model_name)
+        fallback = False
         
         try:
             # Determine device
             device_name = "cpu" if self.device == -1 else f"cuda:{self.device}"
-            logger.info(f"📱 Using device: {device_name}")
+            logger.info("📱 Using device: %s", device_name)
             
-            # For lightweight deployment, use pipeline
-            # This is more memory efficient than loading model + tokenizer separately
-            # DialoGPT-small optimized settings
-            self.pipeline = pipeline(
-                "text-generation",
-                model=self.model_name,
-                device=self.device,
-                torch_dtype=torch.float16 if self.device >= 0 else torch.float32,
-                pad_token_id=50256,  # GPT-2 pad token
-                return_full_text=False  # Don't return the prompt in output
-            )
+            if settings.MODEL_QUANTIZATION == "none":
+                # For lightweight deployment, use pipeline
+                # This is more memory efficient than loading model + tokenizer separately
+                # DialoGPT-small optimized settings
+                self.pipeline = pipeline(
+                    "text-generation",
+                    model=self.model_name,
+                    device=self.device,
+                    torch_dtype=torch.float16 if self.device >= 0 else torch.float32,
+                    pad_token_id=50256,  # GPT-2 pad token
+                    return_full_text=False  # Don't return the prompt in output
+                )
+            else:
+                self.pipeline = self._create_quantized_pipeline(settings.MODEL_QUANTIZATION)
             
             logger.info("✅ Model loaded successfully")
             
         except Exception as e:
-            logger.error(f"❌ Failed to load model: {e}")
+            logger.error("❌ Failed to load model: %s", e)
             # Fallback to a smaller model
             logger.info("🔄 Falling back to smaller model...")
+            fallback = True
             try:
                 self.model_name = "microsoft/DialoGPT-small"
                 self.pipeline = pipeline(
@@ -64,163 +135,292 @@ class AIService:
                 )
                 logger.info("✅ Fallback model loaded successfully")
             except Exception as fallback_error:
-                logger.error(f"❌ Fallback model failed: {fallback_error}")
+                logger.error("❌ Fallback model failed: %s", fallback_error)
                 raise
+
+        # Causal LMs must be left-padded so batched prompts end right where generation starts
+        self.tokenizer = self.pipeline.tokenizer
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        # Kernel-level optimizations only apply to the primary, unquantized PyTorch model
+        self._optimizable = not fallback and settings.MODEL_QUANTIZATION == "none"
+        if settings.MODEL_BETTERTRANSFORMER and self._optimizable:
+            self._enable_fused_attention()
+
+    async def initialize(self):
+        """Initialize the AI model (unless preloaded) and start the inference workers"""
+        if self.pipeline is None:
+            self.load_model()
+
+        await self.conversation_store.connect()
+
+        # Cache model responses only when generation is deterministic (greedy decoding),
+        # otherwise a cached sample would be replayed to every caller
+        do_sample = self.GENERATION_KWARGS.get(
+            "do_sample", self.pipeline.model.generation_config.do_sample
+        )
+        if settings.RESPONSE_CACHE_ENABLED and not do_sample:
+            self._response_cache = TTLCache(
+                maxsize=settings.RESPONSE_CACHE_SIZE,
+                ttl=settings.RESPONSE_CACHE_TTL
+            )
+            logger.info("🗄️ Response cache enabled")
+
+        # Dedicated inference threads so model calls don't contend in the default pool
+        self._infer_executor = ThreadPoolExecutor(
+            max_workers=settings.INFER_CONCURRENCY,
+            thread_name_prefix="hf-infer"
+        )
+
+        # Compile on the inference thread that will run the model (CUDA graphs are thread-local)
+        if settings.MODEL_COMPILE and self._optimizable:
+            await asyncio.get_running_loop().run_in_executor(self._infer_executor, self._compile_model)
+
+        # Start one background worker per inference thread to batch concurrent prompts.
+        # The queue is bounded so bursts wait here (back-pressure) instead of piling up unbounded
+        self._batch_queue = asyncio.Queue(maxsize=settings.INFER_QUEUE_SIZE)
+        self._batch_worker_tasks = [
+            asyncio.create_task(self._batch_worker())
+            for _ in range(settings.INFER_CONCURRENCY)
+        ]
+
+    def _create_quantized_pipeline(self, quantization: str):
+        """Build the text-generation pipeline around an int8/int4 quantized model"""
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+
+        if self.device >= 0:
+            # GPU: bitsandbytes quantizes the weights while loading
+            from transformers import BitsAndBytesConfig
+
+            if quantization == "int4":
+                quantization_config = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_compute_dtype=torch.float16
+                )
+            else:
+                quantization_config = BitsAndBytesConfig(load_in_8bit=True)
+
+            logger.info("🗜️ Loading %s model with bitsandbytes", quantization)
+            model = AutoModelForCausalLM.from_pretrained(
+                self.model_name,
+                quantization_config=quantization_config,
+                device_map={"": self.device}
+            )
+        else:
+            # CPU: export to ONNX once and run with int8 dynamic quantization
+            from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+            if quantization == "int4":
+                logger.warning("⚠️ int4 is not supported on CPU, using int8")
+
+            save_dir = os.path.join(settings.QUANTIZED_MODEL_DIR, self.model_name.replace("/", "--"))
+            quantized_file = "model_quantized.onnx"
+            if not os.path.exists(os.path.join(save_dir, quantized_file)):
+                logger.info("🗜️ Exporting int8 ONNX model to %s", save_dir)
+                onnx_model = ORTModelForCausalLM.from_pretrained(self.model_name, export=True)
+                onnx_model.save_pretrained(save_dir)
+                quantizer = ORTQuantizer.from_pretrained(onnx_model)
+                quantizer.quantize(
+                    save_dir=save_dir,
+                    quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+                )
+
+            model = ORTModelForCausalLM.from_pretrained(save_dir, file_name=quantized_file)
+
+        return pipeline(
+            "text-generation",
+            model=model,
+            tokenizer=tokenizer,
+            pad_token_id=50256,  # GPT-2 pad token
+            return_full_text=False  # Don't return the prompt in output
+        )
+
+    def _enable_fused_attention(self):
+        """Use fused attention kernels: native SDPA when transformers provides it, BetterTransformer otherwise"""
+        model = self.pipeline.model
+        # Recent transformers load supported models with SDPA attention by default
+        # (and BetterTransformer refuses to convert those)
+        if getattr(model.config, "_attn_implementation", None) == "sdpa":
+            logger.info("⚡ Model already uses fused SDPA attention")
+            return
+
+        try:
+            from optimum.bettertransformer import BetterTransformer
+
+            self.pipeline.model = BetterTransformer.transform(model)
+            logger.info("⚡ Model converted to BetterTransformer")
+        except Exception as e:
+            logger.warning("⚠️ BetterTransformer unavailable, using standard attention: %s", e)
+
+    def _compile_model(self):
+        """Compile the model forward pass and warm it up (blocking)"""
+        logger.info("⚙️ Compiling model with torch.compile...")
+        model = self.pipeline.model
+        eager_forward = model.forward
+        try:
+            model.forward = torch.compile(eager_forward, mode="reduce-overhead", dynamic=True)
+            # Warm up so the first request doesn't pay for compilation (compiler errors surface here)
+            self._run_pipeline(["Human: Hello\nBot:"])
+        except Exception as e:
+            model.forward = eager_forward
+            logger.warning("⚠️ torch.compile failed, running the model uncompiled: %s", e)
+            return
+        logger.info("✅ Model compiled")
+
+    async def shutdown(self):
+        """Stop background workers"""
+        for task in self._batch_worker_tasks:
+            task.cancel()
+        for task in self._batch_worker_tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._batch_worker_tasks = []
+
+        if self._infer_executor is not None:
+            # Waiting for in-flight generation blocks, so keep it off the event loop
+            await asyncio.to_thread(self._infer_executor.shutdown, wait=True)
+            self._infer_executor = None
+
+        # Let history writes from disconnected streams finish before closing the store
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        await self.conversation_store.close()
     
     def _load_business_config(self) -> Dict:
         """Load business configuration from settings"""
         return {
             "name": settings.BUSINESS_NAME,
             "type": settings.BUSINESS_TYPE,
-            "allowed_topics": [topic.strip() for topic in settings.ALLOWED_TOPICS.split(",")],
-            "restricted_topics": [topic.strip() for topic in settings.RESTRICTED_TOPICS.split(",")]
+            "allowed_topics": self._freeze_topics(settings.allowed_topics_list),
+            "restricted_topics": self._freeze_topics(settings.restricted_topics_list)
         }
-    
-    def _is_on_topic(self, message: str) -> Tuple[bool, Optional[str]]:
-        """Check if message is within allowed topics"""
-        message_lower = message.lower()
 
-        # Check for restricted topics
-        for restricted in self.business_config["restricted_topics"]:
-            if restricted.lower() in message_lower:
-                return False, f"I can't provide {restricted}. Let me help you with {self.business_config['type']} related questions instead."
+    @staticmethod
+    def _freeze_topics(topics: Tuple[str, ...]) -> FrozenSet[str]:
+        """Build an immutable set of interned, lowercase topic names"""
+        return frozenset(sys.intern(topic.lower()) for topic in topics)
+    
+    @staticmethod
+    def _compile_topic_pattern(topics) -> Optional[Pattern]:
+        """Compile lowercase topics into one alternation (longest first)"""
+        if not topics:
+            return None
+        alternatives = sorted(topics, key=lambda topic: (-len(topic), topic))
+        return re.compile("|".join(map(re.escape, alternatives)))
+
+    def _is_on_topic(self, message_lower: str) -> Tuple[bool, Optional[str]]:
+        """Check if the (lowercased) message is within allowed topics"""
+        # Check for restricted topics in a single scan of the message
+        match = self._restricted_re.search(message_lower) if self._restricted_re else None
+        if match:
+            restricted = match.group(0)
+            return False, f"I can't provide {restricted}. Let me help you with {self.business_config['type']} related questions instead."
 
         # For now, allow all non-restricted topics
         # You can add more sophisticated topic classification here
         return True, None
 
-    def _get_direct_answer(self, message: str) -> Optional[str]:
-        """Check if we can provide a direct answer from business details"""
-        message_lower = message.lower()
-        business_details = settings.BUSINESS_DETAILS.lower()
-
-        # Define keyword patterns for common questions
-        patterns = {
-            "hours": ["hours", "open", "close", "when are you open", "what time"],
-            "location": ["location", "address", "where are you", "where located"],
-            "contact": ["contact", "phone", "email", "call", "reach"],
-            "pricing": ["price", "cost", "how much", "pricing", "plan"],
-            "shipping": ["shipping", "delivery", "ship"],
-            "returns": ["return", "refund", "money back"],
-            "services": ["service", "what do you do", "what do you offer"],
-        }
-
-        # Check if message matches any pattern
-        for topic, keywords in patterns.items():
-            if any(keyword in message_lower for keyword in keywords):
-                # Extract relevant information from BUSINESS_DETAILS
-                details_full = settings.BUSINESS_DETAILS
-
-                # For hours
-                if topic == "hours" and "hours:" in business_details:
-                    start = details_full.lower().find("hours:")
-                    end = details_full.find(".", start) if "." in details_full[start:] else len(details_full)
-                    return f"Our {details_full[start:end].strip()}. Is there anything else you'd like to know?"
-
-                # For location
-                if topic == "location" and "location:" in business_details:
-                    start = details_full.lower().find("location:")
-                    end = details_full.find(".", start) if "." in details_full[start:] else len(details_full)
-                    return f"We're located at: {details_full[start+9:end].strip()}. Feel free to visit us!"
-
-                # For contact
-                if topic == "contact" and ("phone" in business_details or "email" in business_details):
-                    contact_info = []
-                    if "phone" in business_details:
-                        start = details_full.lower().find("phone")
-                        end = details_full.find(",", start) if "," in details_full[start:start+50] else start+40
-                        contact_info.append(details_full[start:end].strip())
-                    if "email" in business_details:
-                        start = details_full.lower().find("email")
-                        end = details_full.find(".", start) if "." in details_full[start:start+50] else start+40
-                        contact_info.append(details_full[start:end].strip())
-                    return f"You can reach us at: {', '.join(contact_info)}. We're here to help!"
-
-                # For pricing
-                if topic == "pricing" and "pricing:" in business_details:
-                    start = details_full.lower().find("pricing:")
-                    end = details_full.find(".", start) if "." in details_full[start:] else len(details_full)
-                    return f"Our {details_full[start:end].strip()}. Would you like more details on any specific plan?"
-
-                # For shipping
-                if topic == "shipping" and "shipping:" in business_details:
-                    start = details_full.lower().find("shipping:")
-                    end = details_full.find(".", start) if "." in details_full[start:] else len(details_full)
-                    return f"Regarding {details_full[start:end].strip()}. Can I help you with anything else?"
-
-                # For returns
-                if topic == "returns" and "return" in business_details:
-                    start = details_full.lower().find("return")
-                    end = details_full.find(".", start) if "." in details_full[start:] else len(details_full)
-                    return f"Our return policy: {details_full[start:end].strip()}. Let me know if you have questions!"
-
-                # For services
-                if topic == "services" and "services:" in business_details:
-                    start = details_full.lower().find("services:")
-                    end = details_full.find(".", start) if "." in details_full[start:] else len(details_full)
-                    return f"We {details_full[start+9:end].strip()}. What can I help you with today?"
+    @staticmethod
+    def _extract_direct_answers(details_full: str) -> Dict[str, str]:
+        """Pre-build direct answers for each topic covered by business details"""
+        business_details = details_full.lower()
+        answers = {}
+
+        def section_end(start: int) -> int:
+            end = details_full.find(".", start)
+            return end if end != -1 else len(details_full)
+
+        # For hours
+        start = business_details.find("hours:")
+        if start != -1:
+            answers["hours"] = f"Our {details_full[start:section_end(start)].strip()}. Is there anything else you'd like to know?"
+
+        # For location
+        start = business_details.find("location:")
+        if start != -1:
+            answers["location"] = f"We're located at: {details_full[start+9:section_end(start)].strip()}. Feel free to visit us!"
+
+        # For contact
+        contact_info = []
+        start = business_details.find("phone")
+        if start != -1:
+            end = details_full.find(",", start) if "," in details_full[start:start+50] else start+40
+            contact_info.append(details_full[start:end].strip())
+        start = business_details.find("email")
+        if start != -1:
+            end = details_full.find(".", start) if "." in details_full[start:start+50] else start+40
+            contact_info.append(details_full[start:end].strip())
+        if contact_info:
+            answers["contact"] = f"You can reach us at: {', '.join(contact_info)}. We're here to help!"
+
+        # For pricing
+        start = business_details.find("pricing:")
+        if start != -1:
+            answers["pricing"] = f"Our {details_full[start:section_end(start)].strip()}. Would you like more details on any specific plan?"
+
+        # For shipping
+        start = business_details.find("shipping:")
+        if start != -1:
+            answers["shipping"] = f"Regarding {details_full[start:section_end(start)].strip()}. Can I help you with anything else?"
+
+        # For returns
+        start = business_details.find("return")
+        if start != -1:
+            answers["returns"] = f"Our return policy: {details_full[start:section_end(start)].strip()}. Let me know if you have questions!"
+
+        # For services
+        start = business_details.find("services:")
+        if start != -1:
+            answers["services"] = f"We {details_full[start+9:section_end(start)].strip()}. What can I help you with today?"
+
+        # Keep keyword priority order
+        return {topic: answers[topic] for topic in AIService.DIRECT_ANSWER_KEYWORDS if topic in answers}
+
+    @staticmethod
+    def _compile_direct_answer_pattern(answers: Dict[str, str]) -> Optional[Pattern]:
+        """Compile keywords of answerable topics into one pattern with a named group per topic"""
+        groups = [
+            f"(?P<{topic}>{'|'.join(map(re.escape, AIService.DIRECT_ANSWER_KEYWORDS[topic]))})"
+            for topic in answers
+        ]
+        return re.compile("|".join(groups)) if groups else None
+
+    def _get_direct_answer(self, message_lower: str) -> Optional[str]:
+        """Check if we can provide a direct answer from business details for the (lowercased) message"""
+        if not self._direct_answer_re:
+            return None
+
+        # Check if message matches any pattern, answering the highest priority topic
+        matched_topics = {match.lastgroup for match in self._direct_answer_re.finditer(message_lower)}
+        for topic, answer in self._direct_answers.items():
+            if topic in matched_topics:
+                return answer
 
         return None
     
-    def _build_conversation_context(self, conversation_history: List[ChatMessage], max_context: int = 3) -> str:
-        """Build conversation context from history"""
-        if not conversation_history:
-            return ""
-        
-        # Take last few messages for context
-        recent_messages = conversation_history[-max_context:]
-        context_parts = []
-        
-        for msg in recent_messages:
-            role = "Human" if msg.role == "user" else "Assistant"
-            context_parts.append(f"{role}: {msg.content}")
-        
-        return "\n".join(context_parts)
-    
-    def _create_business_prompt(self, user_message: str, context: str = "") -> str:
+    def _create_business_prompt(self, user_message: str, conversation_history: Optional[List[ChatMessage]] = None) -> str:
         """Create a simple conversational prompt for DialoGPT"""
         # DialoGPT-small works best with minimal, conversational format
-        # Build simple back-and-forth dialogue
-
-        prompt_parts = []
-
-        # Add context if available (keep it minimal - just last exchange)
-        if context:
-            # Extract just the last exchange from context
-            context_lines = context.strip().split('\n')
-            if len(context_lines) > 2:
-                # Take only the last 2 lines (one exchange)
-                context_lines = context_lines[-2:]
-
-            for line in context_lines:
-                # Convert to simple Human/Bot format
-                if line.startswith("Human:"):
-                    prompt_parts.append(line)
-                elif line.startswith("Assistant:"):
-                    prompt_parts.append(line.replace("Assistant:", "Bot:"))
-
-        # Add current message
-        prompt_parts.append(f"Human: {user_message}")
-        prompt_parts.append("Bot:")
-
-        return "\n".join(prompt_parts)
+        # Build simple back-and-forth dialogue, keeping context minimal - just the last exchange
+        recent_messages = conversation_history[-PROMPT_HISTORY_MESSAGES:] if conversation_history else ()
+        # Multi-line messages are flattened so each turn stays on one line
+        history = "".join(
+            f"{self.ROLE_PREFIXES.get(msg.role, 'Bot: ')}{' '.join(msg.content.splitlines())}\n"
+            for msg in recent_messages
+        )
+
+        return f"{history}Human: {user_message}\nBot:"
     
-    async def chat(
-        self,
-        message: str,
-        conversation_id: Optional[str] = None,
-        conversation_history: Optional[List[ChatMessage]] = None,
-        context: Optional[str] = None
-    ) -> Dict:
-        """Process chat message and return response"""
-        start_time = time.time()
-        
-        # Generate conversation ID if not provided
-        if not conversation_id:
-            conversation_id = str(uuid.uuid4())
-        
+    def _get_rule_based_response(self, message: str, conversation_id: str, start_time: float) -> Optional[Dict]:
+        """Answer from business rules/knowledge without running the model, if possible"""
+        # Lowercase once for all keyword matching; the patterns are compiled lowercase
+        message_lower = message.lower()
+
         # Check topic appropriateness
-        is_appropriate, redirect_message = self._is_on_topic(message)
+        is_appropriate, redirect_message = self._is_on_topic(message_lower)
         if not is_appropriate:
             return {
                 "response": redirect_message,
@@ -231,32 +431,78 @@ class AIService:
             }
 
         # Check if we can provide a direct answer from business details
-        direct_answer = self._get_direct_answer(message)
+        direct_answer = self._get_direct_answer(message_lower)
         if direct_answer:
             return {
                 "response": direct_answer,
                 "conversation_id": conversation_id,
                 "model_used": "business_knowledge",
                 "processing_time": time.time() - start_time,
-                "tokens_used": len(direct_answer.split())
+                "tokens_used": self._count_tokens(direct_answer)
             }
 
+        return None
+
+    def _count_tokens(self, text: str) -> int:
+        """Count model tokens in text"""
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _error_response(self, conversation_id: str, start_time: float) -> Dict:
+        """Response returned when generation fails"""
+        return {
+            "response": "I apologize, but I'm experiencing technical difficulties. Please try again in a moment.",
+            "conversation_id": conversation_id,
+            "model_used": "error_handler",
+            "processing_time": time.time() - start_time,
+            "tokens_used": 0
+        }
+
+    async def _prepare_chat(
+        self,
+        message: str,
+        conversation_id: Optional[str],
+        conversation_history: Optional[List[ChatMessage]],
+        start_time: float
+    ) -> Tuple[str, Union[Dict, str]]:
+        """Resolve the conversation ID and return it with either a rule-based response or the model prompt"""
+        # Generate conversation ID if not provided
+        is_new_conversation = not conversation_id
+        if is_new_conversation:
+            conversation_id = secrets.token_hex(16)
+
+        rule_based_response = self._get_rule_based_response(message, conversation_id, start_time)
+        if rule_based_response:
+            # Stored like model turns, so prompts built from the stored history include this exchange
+            await self._store_exchange(conversation_id, message, rule_based_response["response"])
+            return conversation_id, rule_based_response
+
+        # Clients may send only the new message for an existing conversation - use the stored history then
+        # (a conversation that was just created has nothing stored yet)
+        if not conversation_history and not is_new_conversation:
+            try:
+                conversation_history = await self.conversation_store.get(conversation_id)
+            except Exception as e:
+                logger.error("❌ Error loading conversation history: %s", e)
+
+        # Additional context is not added to the prompt - DialoGPT-small responds best to bare dialogue
+        return conversation_id, self._create_business_prompt(message, conversation_history)
+
+    async def chat(
+        self,
+        message: str,
+        conversation_id: Optional[str] = None,
+        conversation_history: Optional[List[ChatMessage]] = None,
+        context: Optional[str] = None
+    ) -> Dict:
+        """Process chat message and return response"""
+        start_time = time.time()
+        conversation_id, prompt = await self._prepare_chat(message, conversation_id, conversation_history, start_time)
+        if isinstance(prompt, dict):
+            return prompt
+
         try:
-            # Build conversation context
-            if conversation_history:
-                conversation_context = self._build_conversation_context(conversation_history)
-            else:
-                conversation_context = ""
-            
-            # Add any additional context
-            if context:
-                conversation_context += f"\nAdditional Context: {context}"
-            
-            # Create business-specific prompt
-            prompt = self._create_business_prompt(message, conversation_context)
-            
             # Generate response using the model
-            logger.info(f"🤔 Generating response for: {message[:50]}...")
+            logger.info("🤔 Generating response for: %s...", message[:50])
             
             # Run inference
             response = await self._generate_response(prompt)
@@ -266,81 +512,242 @@ class AIService:
             
             processing_time = time.time() - start_time
             
-            # Store conversation in memory (simple in-memory storage)
-            if conversation_id not in self.conversation_memory:
-                self.conversation_memory[conversation_id] = []
-            
-            self.conversation_memory[conversation_id].extend([
-                ChatMessage(role="user", content=message),
-                ChatMessage(role="assistant", content=cleaned_response)
-            ])
-            
-            # Keep only last 10 messages per conversation
-            if len(self.conversation_memory[conversation_id]) > 10:
-                self.conversation_memory[conversation_id] = self.conversation_memory[conversation_id][-10:]
+            await self._store_exchange(conversation_id, message, cleaned_response)
             
             return {
                 "response": cleaned_response,
                 "conversation_id": conversation_id,
                 "model_used": self.model_name,
                 "processing_time": processing_time,
-                "tokens_used": len(cleaned_response.split())  # Rough token estimate
+                "tokens_used": self._count_tokens(cleaned_response)
             }
             
         except Exception as e:
-            logger.error(f"❌ Error generating response: {e}")
-            return {
-                "response": "I apologize, but I'm experiencing technical difficulties. Please try again in a moment.",
-                "conversation_id": conversation_id,
-                "model_used": "error_handler",
-                "processing_time": time.time() - start_time,
-                "tokens_used": 0
-            }
+            logger.error("❌ Error generating response: %s", e)
+            return self._error_response(conversation_id, start_time)
+
+    async def chat_stream(
+        self,
+        message: str,
+        conversation_id: Optional[str] = None,
+        conversation_history: Optional[List[ChatMessage]] = None,
+        context: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """Process chat message, yielding {"token": ...} events while generating and a final response event"""
+        start_time = time.time()
+        conversation_id, prompt = await self._prepare_chat(message, conversation_id, conversation_history, start_time)
+        if isinstance(prompt, dict):
+            yield {"token": prompt["response"]}
+            yield {**prompt, "done": True}
+            return
+
+        chunks = []
+        cleaned_response = None
+        # Leading text is held back until speaker markers and an echoed message can be stripped from it
+        leading = ""
+        started = False
+        try:
+            logger.info("🤔 Streaming response for: %s...", message[:50])
+
+            async for chunk in self._stream_response(prompt):
+                chunks.append(chunk)
+                if started:
+                    yield {"token": chunk}
+                    continue
+                leading, undecided = self._strip_stream_prefix(leading + chunk, message)
+                if not undecided:
+                    started = True
+                    yield {"token": leading}
+
+            if not started and leading:
+                yield {"token": leading}
+
+        except Exception as e:
+            logger.error("❌ Error streaming response: %s", e)
+            yield {**self._error_response(conversation_id, start_time), "done": True}
+            return
+
+        finally:
+            # Store whatever was generated, even if the client disconnected mid-stream. A disconnect
+            # cancels this generator (and keeps re-cancelling each await), so the write runs as its
+            # own shielded task that completes regardless
+            if chunks:
+                cleaned_response = self._clean_response("".join(chunks).strip(), message)
+                write = asyncio.create_task(self._store_exchange(conversation_id, message, cleaned_response))
+                self._pending_writes.add(write)
+                write.add_done_callback(self._pending_writes.discard)
+                await asyncio.shield(write)
+
+        if cleaned_response is None:
+            cleaned_response = self._clean_response("", message)
+
+        yield {
+            "response": cleaned_response,
+            "conversation_id": conversation_id,
+            "model_used": self.model_name,
+            "processing_time": time.time() - start_time,
+            "tokens_used": self._count_tokens(cleaned_response),
+            "done": True
+        }
     
+    def _strip_stream_prefix(self, text: str, original_message: str) -> Tuple[str, bool]:
+        """Strip leading speaker markers and an echoed user message from the start of a streamed response.
+        Returns the remaining text and whether it could still be the start of a marker or the echo"""
+        while True:
+            text = text.lstrip()
+            match = self.RESPONSE_PREFIX_RE.match(text)
+            if match:
+                text = text[match.end():]
+            elif original_message and text.startswith(original_message):
+                text = text[len(original_message):]
+            else:
+                break
+
+        undecided = not text or any(
+            candidate.startswith(text) for candidate in (*self.RESPONSE_MARKERS, original_message)
+        )
+        return text, undecided
+
+    async def _store_exchange(self, conversation_id: str, message: str, response: str):
+        """Store a user message and its response (in memory, or Redis when configured)"""
+        # Failures are only logged: the reply has already been produced and is still returned
+        try:
+            await self.conversation_store.append(conversation_id, [
+                ChatMessage(role="user", content=message),
+                ChatMessage(role="assistant", content=response)
+            ])
+        except Exception as e:
+            logger.error("❌ Error storing conversation: %s", e)
+
     async def _generate_response(self, prompt: str) -> str:
         """Generate response using the AI model"""
+        cache_key = None
+        if self._response_cache is not None:
+            cache_key = self._response_cache_key(prompt)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         try:
-            # Run in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.pipeline(
-                    prompt,
-                    max_new_tokens=50,  # Reduced for DialoGPT-small - it works better with shorter responses
-                    temperature=0.8,  # Slightly higher for more creative responses
-                    top_p=0.9,  # Nucleus sampling for better quality
-                    pad_token_id=self.pipeline.tokenizer.eos_token_id,
-                    eos_token_id=self.pipeline.tokenizer.eos_token_id,
-                    no_repeat_ngram_size=3  # Prevent repetition
-                )
-            )
+            # Hand the prompt to the batch worker and wait for its result
+            future = asyncio.get_running_loop().create_future()
+            await self._batch_queue.put((prompt, future))
+            response = await future
 
             if response and len(response) > 0:
                 generated = response[0]['generated_text'].strip()
                 # DialoGPT sometimes returns empty or very short responses
                 if len(generated) < 3:
                     return "I'm not sure how to respond to that. Could you please rephrase your question?"
+                if cache_key is not None:
+                    self._response_cache[cache_key] = generated
                 return generated
             else:
                 return "I'm not sure how to respond to that. Could you please rephrase your question?"
 
         except Exception as e:
-            logger.error(f"Model generation error: {e}")
+            logger.error("Model generation error: %s", e)
             return "I apologize, but I'm having trouble processing your request right now."
+
+    def _response_cache_key(self, prompt: str) -> str:
+        """Build the response cache key from the prompt and sampling params"""
+        digest = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+        return f"{digest}|{self.GENERATION_KWARGS['temperature']:.2f}"
+
+    async def _batch_worker(self):
+        """Coalesce queued prompts into batched pipeline calls"""
+        loop = asyncio.get_running_loop()
+        window = settings.BATCH_WINDOW_MS / 1000
+
+        while True:
+            # Wait for the first prompt, then collect more until the window closes or the batch is full
+            batch = [await self._batch_queue.get()]
+            deadline = loop.time() + window
+            while len(batch) < settings.BATCH_MAX_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._batch_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Skip requests whose callers have gone away while queued
+            batch = [(prompt, future) for prompt, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            prompts = [prompt for prompt, _ in batch]
+            try:
+                # Run on the inference threads to avoid blocking
+                results = await loop.run_in_executor(self._infer_executor, self._run_pipeline, prompts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _run_pipeline(self, prompts: List[str]) -> List[List[Dict]]:
+        """Run a single batched generation pass (blocking)"""
+        return self.pipeline(
+            prompts,
+            batch_size=len(prompts),
+            pad_token_id=self.tokenizer.eos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            **self.GENERATION_KWARGS
+        )
     
+    async def _stream_response(self, prompt: str) -> AsyncIterator[str]:
+        """Generate a response token by token (bypasses batching and the response cache)"""
+        tokenizer = self.tokenizer
+        model = self.pipeline.model
+        streamer = AsyncTextStreamer(tokenizer, asyncio.get_running_loop(), skip_special_tokens=True)
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+
+        def generate():
+            try:
+                # Skip generation entirely if the reader went away while this was queued
+                if not streamer.cancelled.is_set():
+                    model.generate(
+                        **inputs,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([streamer]),
+                        pad_token_id=tokenizer.eos_token_id,
+                        eos_token_id=tokenizer.eos_token_id,
+                        **self.GENERATION_KWARGS
+                    )
+            except Exception as e:
+                logger.error("Model generation error: %s", e)
+            finally:
+                # Always unblock the reader, even if generation failed or was skipped
+                streamer.end()
+
+        # Generate on the inference threads; tokens are pushed to this coroutine's queue as they are
+        # decoded, so waiting for them doesn't hold a thread
+        self._infer_executor.submit(generate)
+
+        try:
+            while True:
+                chunk = await streamer.queue.get()
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            # Stop (or skip) generation once the client stops reading
+            streamer.cancelled.set()
+
     def _clean_response(self, response: str, original_message: str) -> str:
         """Clean and post-process the AI response"""
         if not response:
             return "I'm not sure how to respond to that. Could you please rephrase your question?"
 
-        # Remove any repetition of the user's message
-        cleaned = response.replace(original_message, "").strip()
-
-        # Remove common unwanted prefixes (DialoGPT specific)
-        prefixes_to_remove = ["ASSISTANT:", "Assistant:", "AI:", "Bot:", "Human:", "USER:", "User:"]
-        for prefix in prefixes_to_remove:
-            if cleaned.startswith(prefix):
-                cleaned = cleaned[len(prefix):].strip()
+        # Remove a repetition of the user's message and common unwanted prefixes (DialoGPT specific)
+        cleaned = self.RESPONSE_PREFIX_RE.sub("", response.replace(original_message, "", 1).strip())
 
         # Remove any remaining conversational markers that DialoGPT might add
         lines = cleaned.split('\n')
@@ -377,11 +784,10 @@ class AIService:
 
         return cleaned
     
-    def get_conversation_history(self, conversation_id: str) -> List[ChatMessage]:
+    async def get_conversation_history(self, conversation_id: str) -> List[ChatMessage]:
         """Retrieve conversation history"""
-        return self.conversation_memory.get(conversation_id, [])
+        return await self.conversation_store.get(conversation_id)
     
-    def clear_conversation(self, conversation_id: str):
+    async def clear_conversation(self, conversation_id: str):
         """Clear specific conversation history"""
-        if conversation_id in self.conversation_memory:
-            del self.conversation_memory[conversation_id]
\ No newline at end of file
+        await self.conversation_store.clear(conversation_id)
\ No newline at end of file
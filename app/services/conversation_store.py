@@ -0,0 +1,114 @@
+"""
+Conversation Store - Conversation history storage (in-memory or Redis)
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, List
+from cachetools import LRUCache
+import redis.asyncio as redis
+from app.core.config import settings
+from app.models.chat import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+class InMemoryConversationStore:
+    """Per-process conversation store (history is lost on restart and not shared between workers)"""
+
+    # Methods are async to match the Redis store; they are plain dict operations that never block,
+    # so they run inline on the event loop rather than via asyncio.to_thread
+
+    def __init__(self, max_conversations: int, max_messages: int):
+        self.max_messages = max_messages
+        # Least recently used conversations are evicted once max_conversations is reached
+        self.conversations: LRUCache[str, Deque[ChatMessage]] = LRUCache(maxsize=max_conversations)
+
+    async def connect(self):
+        """Nothing to connect for in-memory storage"""
+
+    async def close(self):
+        """Nothing to close for in-memory storage"""
+
+    async def append(self, conversation_id: str, messages: List[ChatMessage]):
+        """Append messages, keeping only the most recent ones"""
+        history = self.conversations.setdefault(conversation_id, deque(maxlen=self.max_messages))
+        history.extend(messages)
+
+    async def get(self, conversation_id: str) -> List[ChatMessage]:
+        """Retrieve conversation history"""
+        return list(self.conversations.get(conversation_id, ()))
+
+    async def clear(self, conversation_id: str):
+        """Clear conversation history"""
+        self.conversations.pop(conversation_id, None)
+
+class RedisConversationStore:
+    """Redis-backed conversation store shared by all workers and instances"""
+
+    def __init__(self, url: str, max_messages: int, ttl: int, max_connections: int, warm_connections: int, pool_timeout: float):
+        self.url = url
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.warm_connections = min(warm_connections, max_connections)
+        self.redis = None
+
+    async def connect(self):
+        """Create the connection pool and open connections up front"""
+        # A blocking pool makes bursts wait for a free connection instead of failing with "Too many connections"
+        pool = redis.BlockingConnectionPool.from_url(
+            self.url,
+            max_connections=self.max_connections,
+            timeout=self.pool_timeout
+        )
+        self.redis = redis.Redis.from_pool(pool)
+        # Concurrent PINGs each check out their own connection, leaving them warm in the pool
+        await asyncio.gather(*(self.redis.ping() for _ in range(self.warm_connections)))
+        logger.info("🔌 Connected to Redis (%s connections warmed)", self.warm_connections)
+
+    async def close(self):
+        """Close all pooled connections"""
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+    @staticmethod
+    def _key(conversation_id: str) -> str:
+        return f"conv:{conversation_id}"
+
+    async def append(self, conversation_id: str, messages: List[ChatMessage]):
+        """Append messages, keeping only the most recent ones"""
+        key = self._key(conversation_id)
+        # Push, trim and refresh the expiry in a single round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(key, *(message.model_dump_json() for message in messages))
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def get(self, conversation_id: str) -> List[ChatMessage]:
+        """Retrieve conversation history"""
+        raw_messages = await self.redis.lrange(self._key(conversation_id), -self.max_messages, -1)
+        return [ChatMessage.model_validate_json(raw) for raw in raw_messages]
+
+    async def clear(self, conversation_id: str):
+        """Clear conversation history"""
+        await self.redis.delete(self._key(conversation_id))
+
+def create_conversation_store(max_messages: int = 10):
+    """Use Redis when REDIS_URL is configured, otherwise keep history in memory"""
+    if settings.REDIS_URL:
+        return RedisConversationStore(
+            url=settings.REDIS_URL,
+            max_messages=max_messages,
+            ttl=settings.CONVERSATION_TTL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            warm_connections=settings.REDIS_WARM_CONNECTIONS,
+            pool_timeout=settings.REDIS_POOL_TIMEOUT
+        )
+    return InMemoryConversationStore(
+        max_conversations=settings.MAX_CONVERSATIONS,
+        max_messages=max_messages
+    )
@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration - multi-worker deployment with a shared, preloaded model
+Run with: gunicorn app.main:app -c gunicorn.conf.py
+"""
+
+import gc
+import os
+
+# Load the app (and model) once in the master; forked workers share the weights copy-on-write
+os.environ.setdefault("PRELOAD_MODEL", "true")
+preload_app = True
+
+# Imported after PRELOAD_MODEL is defaulted, since settings are read once on import
+from app.core.config import settings
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Generation can take a while on CPU. Worker startup counts against the timeout too, so allow
+# longer when each worker loads the model itself (GPU) or compiles and warms it up (MODEL_COMPILE)
+slow_startup = settings.MODEL_DEVICE != -1 or settings.MODEL_COMPILE
+timeout = int(os.getenv("WORKER_TIMEOUT", 600 if slow_startup else 120))
+
+def pre_fork(server, worker):
+    """Keep the preloaded model's pages shared after fork"""
+    # Frozen objects are skipped by the garbage collector, so collections in the workers
+    # don't write to (and un-share) the pages holding everything loaded in the master
+    gc.freeze()
@@ -4,75 +4,115 @@ Simple test script to verify the chatbot API is working
 Run this after starting the server locally
 """
 
+import argparse
+import asyncio
+import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-API_BASE = "http://localhost:8000"
+try:
+    import aiohttp
+except ImportError:  # Optional: only needed for the default async chat driver
+    aiohttp = None
 
-def test_health_check():
+try:
+    from orjson import loads as json_loads
+except ImportError:  # Optional: faster response parsing, falls back to the stdlib
+    json_loads = json.loads
+
+# Point the tests at another server (e.g. staging) with API_BASE=https://... python test_api.py
+API_BASE = os.environ.get("API_BASE", "http://localhost:8000").rstrip("/")
+HEALTH_URL = f"{API_BASE}/health"
+CHAT_URL = f"{API_BASE}/api/v1/chat"
+CONFIG_URL = f"{API_BASE}/api/v1/config"
+
+# Independent conversations run in parallel with the config probe, one worker each
+CHAT_CONVERSATIONS = 3
+MAX_WORKERS = CHAT_CONVERSATIONS + 1
+
+# Transient failures (cold start, proxy errors, 429 with Retry-After) are retried with exponential backoff;
+# the final response is still returned so its status code is reported as before. The aiohttp driver
+# follows the same policy in post_with_retry
+RETRY_POLICY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=[429, 502, 503, 504],
+    allowed_methods=["GET", "POST"],
+    raise_on_status=False
+)
+
+# Every request sends and expects JSON
+JSON_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+# The server may still be starting (e.g. `--reload`), so the health check keeps polling before giving up
+# (about 3s in total; its requests bypass RETRY_POLICY so the retries don't multiply)
+HEALTH_CHECK_ATTEMPTS = 10
+HEALTH_CHECK_INTERVAL = 0.3  # seconds
+
+# /api/v1/config rarely changes between runs, so its response is reused from disk for a short while
+CONFIG_CACHE_FILE = ".test_api_cache.json"
+CONFIG_CACHE_TTL = 60  # seconds
+
+# Set by --quiet: per-request progress is skipped and only errors and the results summary are printed
+QUIET = False
+
+TEST_MESSAGES = [
+    "Hello, how are you today?",
+    "What are your business hours?",
+    "Can you help me with pricing?",
+    "Tell me about your services",
+]
+
+def log(*args, **kwargs):
+    """Print progress output unless running with --quiet"""
+    if not QUIET:
+        print(*args, **kwargs)
+
+def test_health_check(session):
     """Test the health endpoint"""
-    print("🔍 Testing health check...")
-    try:
-        response = requests.get(f"{API_BASE}/health")
-        if response.status_code == 200:
-            print("✅ Health check passed")
-            print(f"   Response: {response.json()}")
-        else:
-            print(f"❌ Health check failed: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Connection error: {e}")
-        return False
+    log("🔍 Testing health check...")
+    for attempt in range(1, HEALTH_CHECK_ATTEMPTS + 1):
+        try:
+            response = session.get(HEALTH_URL)
+            break
+        except requests.exceptions.RequestException as e:
+            if attempt == HEALTH_CHECK_ATTEMPTS:
+                print(f"❌ Connection error: {e}")
+                return False
+            time.sleep(HEALTH_CHECK_INTERVAL)
+
+    if response.status_code == 200:
+        log("✅ Health check passed")
+        log(f"   Response: {json_loads(response.content)}")
+    else:
+        print(f"❌ Health check failed: {response.status_code}")
     return True
 
-def test_chat_endpoint():
-    """Test the chat endpoint"""
-    print("\n🤖 Testing chat endpoint...")
-    
-    test_messages = [
-        "Hello, how are you today?",
-        "What are your business hours?",
-        "Can you help me with pricing?",
-        "Tell me about your services",
-    ]
+def test_chat_endpoint(session, label=1):
+    """Test the chat endpoint with one conversation"""
+    # One payload per conversation, updated in place each turn (it is serialized when the request is sent)
+    payload = {"message": None, "conversation_id": None}
     
-    conversation_id = None
-    conversation_history = []
-    
-    for message in test_messages:
-        print(f"\n💬 Sending: {message}")
-        
-        payload = {
-            "message": message,
-            "conversation_id": conversation_id,
-            "conversation_history": conversation_history
-        }
+    for message in TEST_MESSAGES:
+        log(f"\n💬 [{label}] Sending: {message}")
+        payload["message"] = message
         
         try:
-            start_time = time.time()
-            response = requests.post(
-                f"{API_BASE}/api/v1/chat",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-            response_time = time.time() - start_time
+            response = session.post(CHAT_URL, json=payload)
             
             if response.status_code == 200:
-                data = response.json()
-                print(f"🤖 Response: {data['response']}")
-                print(f"⏱️  Processing time: {data['processing_time']:.2f}s")
-                print(f"🔗 Conversation ID: {data['conversation_id']}")
+                data = json_loads(response.content)
+                print_chat_reply(label, data, response.elapsed.total_seconds())
                 
-                # Update conversation tracking
-                conversation_id = data['conversation_id']
-                conversation_history.extend([
-                    {"role": "user", "content": message},
-                    {"role": "assistant", "content": data['response']}
-                ])
+                # The server keeps the history, so only the conversation ID is carried forward
+                payload["conversation_id"] = data['conversation_id']
                 
             else:
-                print(f"❌ Chat failed: {response.status_code}")
-                print(f"   Error: {response.text}")
+                print(f"❌ [{label}] Chat failed: {response.status_code}\n   Error: {response.text}")
                 return False
                 
         except requests.exceptions.RequestException as e:
@@ -81,38 +121,186 @@ def test_chat_endpoint():
     
     return True
 
-def test_config_endpoint():
-    """Test the config endpoint"""
-    print("\n⚙️  Testing config endpoint...")
-    try:
-        response = requests.get(f"{API_BASE}/api/v1/config")
-        if response.status_code == 200:
-            config = response.json()
-            print("✅ Config retrieved successfully")
-            print(f"   Business: {config['business_config']['name']}")
-            print(f"   Type: {config['business_config']['type']}")
-            print(f"   Model: {config['model_info']['name']}")
+def print_chat_reply(label, data, round_trip_time):
+    """Print a chat response block"""
+    if QUIET:
+        return
+    # One print per block so output from parallel conversations doesn't interleave mid-block
+    print(
+        f"🤖 [{label}] Response: {data['response']}\n"
+        f"⏱️  [{label}] Processing time: {data['processing_time']:.2f}s (round trip {round_trip_time:.2f}s)\n"
+        f"🔗 [{label}] Conversation ID: {data['conversation_id']}"
+    )
+
+async def post_with_retry(session, url, payload):
+    """POST with aiohttp, retrying connection errors and retryable statuses per RETRY_POLICY"""
+    for attempt in range(RETRY_POLICY.total + 1):
+        last_attempt = attempt == RETRY_POLICY.total
+        delay = RETRY_POLICY.backoff_factor * 2 ** attempt
+        try:
+            response = await session.post(url, json=payload)
+        except aiohttp.ClientConnectionError:
+            if last_attempt:
+                raise
         else:
+            if response.status not in RETRY_POLICY.status_forcelist or last_attempt:
+                # As with raise_on_status=False, the final response is returned for the caller to report
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = int(retry_after)
+            response.release()
+        await asyncio.sleep(delay)
+
+async def run_conversation(session, label):
+    """Test the chat endpoint with one conversation using aiohttp"""
+    # One payload per conversation, updated in place each turn (it is serialized when the request is sent)
+    payload = {"message": None, "conversation_id": None}
+    loop = asyncio.get_running_loop()
+
+    for message in TEST_MESSAGES:
+        log(f"\n💬 [{label}] Sending: {message}")
+        payload["message"] = message
+
+        try:
+            # The loop's monotonic clock isn't affected by wall-clock adjustments
+            sent_at = loop.time()
+            async with await post_with_retry(session, CHAT_URL, payload) as response:
+                if response.status != 200:
+                    print(f"❌ [{label}] Chat failed: {response.status}\n   Error: {await response.text()}")
+                    return False
+                data = await response.json(loads=json_loads)
+            round_trip_time = loop.time() - sent_at
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"❌ [{label}] Connection error: {str(e) or type(e).__name__}")
+            return False
+
+        print_chat_reply(label, data, round_trip_time)
+
+        # The server keeps the history, so only the conversation ID is carried forward
+        payload["conversation_id"] = data['conversation_id']
+
+    return True
+
+async def run_parallel_tests_async(session, use_cache):
+    """Run the chat conversations on one aiohttp session while the config probe runs in a thread"""
+    connector = aiohttp.TCPConnector(limit=32, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector, headers=JSON_HEADERS) as chat_session:
+        config_success, *chat_results = await asyncio.gather(
+            asyncio.to_thread(test_config_endpoint, session, use_cache),
+            *(run_conversation(chat_session, label) for label in range(1, CHAT_CONVERSATIONS + 1))
+        )
+    return all(chat_results), config_success
+
+def run_parallel_tests(session, use_cache):
+    """Run the chat conversations and the config probe on worker threads"""
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        config_future = executor.submit(test_config_endpoint, session, use_cache)
+        chat_futures = [
+            executor.submit(test_chat_endpoint, session, label)
+            for label in range(1, CHAT_CONVERSATIONS + 1)
+        ]
+        results = {future: future.result() for future in as_completed([config_future, *chat_futures])}
+
+    return all(results[future] for future in chat_futures), results[config_future]
+
+def load_cache():
+    """Load cached responses, keyed by URL"""
+    try:
+        with open(CONFIG_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def get_cached_response(url):
+    """Return the cached JSON body for a URL if it is still fresh"""
+    entry = load_cache().get(url)
+    if entry and time.time() - entry["cached_at"] < CONFIG_CACHE_TTL:
+        return entry["body"]
+    return None
+
+def set_cached_response(url, body):
+    """Store a JSON body for a URL"""
+    cache = load_cache()
+    cache[url] = {"cached_at": time.time(), "body": body}
+    try:
+        with open(CONFIG_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"⚠️  Could not write response cache: {e}")
+
+def test_config_endpoint(session, use_cache=True):
+    """Test the config endpoint"""
+    log("\n⚙️  Testing config endpoint...")
+    config = get_cached_response(CONFIG_URL) if use_cache else None
+
+    if config is not None:
+        source = f"loaded from cache (less than {CONFIG_CACHE_TTL}s old)"
+    else:
+        try:
+            response = session.get(CONFIG_URL)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Connection error: {e}")
+            return False
+        if response.status_code != 200:
             print(f"❌ Config failed: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Connection error: {e}")
-        return False
+            return True
+        config = json_loads(response.content)
+        set_cached_response(CONFIG_URL, config)
+        source = "retrieved successfully"
+
+    # Single print so the block isn't interleaved with the parallel chat output
+    log(
+        f"✅ Config {source}\n"
+        f"   Business: {config['business_config']['name']}\n"
+        f"   Type: {config['business_config']['type']}\n"
+        f"   Model: {config['model_info']['name']}"
+    )
     return True
 
 def main():
     """Run all tests"""
+    global QUIET
+    parser = argparse.ArgumentParser(description="Smoke test the chatbot API")
+    parser.add_argument("--sync", action="store_true", help="drive the chat conversations with requests and threads instead of aiohttp")
+    parser.add_argument("--no-cache", action="store_true", help=f"always fetch /api/v1/config instead of reusing a response cached in {CONFIG_CACHE_FILE}")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors and the final results")
+    args = parser.parse_args()
+    QUIET = args.quiet
+
+    use_async = not args.sync
+    if use_async and aiohttp is None:
+        print("⚠️  aiohttp is not installed, falling back to --sync")
+        use_async = False
+
     print("🧪 AI Chatbot API Test Suite")
     print("=" * 40)
     
+    # One session for all requests so they reuse pooled keep-alive connections
+    with requests.Session() as session:
+        session.headers.update(JSON_HEADERS)
+        # One pooled connection per worker thread
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS, max_retries=RETRY_POLICY)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # The health check does its own polling, so it gets an adapter without retries
+        session.mount(HEALTH_URL, HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
+        run_tests(session, use_async, use_cache=not args.no_cache)
+
+def run_tests(session, use_async, use_cache):
+    """Run the endpoint tests using a shared session"""
     # Test health first
-    if not test_health_check():
+    if not test_health_check(session):
         print("\n❌ Health check failed, aborting tests")
-        print("Make sure the server is running: uvicorn app.main:app --reload")
+        print(f"Make sure the server is running at {API_BASE}: uvicorn app.main:app --reload")
         return
     
-    # Test other endpoints
-    chat_success = test_chat_endpoint()
-    config_success = test_config_endpoint()
+    # Test other endpoints concurrently; they don't depend on each other
+    log(f"\n🤖 Testing chat endpoint with {CHAT_CONVERSATIONS} parallel conversations...")
+    if use_async:
+        chat_success, config_success = asyncio.run(run_parallel_tests_async(session, use_cache))
+    else:
+        chat_success, config_success = run_parallel_tests(session, use_cache)
     
     print("\n" + "=" * 40)
     print("📊 Test Results:")